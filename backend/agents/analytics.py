@@ -5,22 +5,87 @@ Tracks metrics, performance, and user interactions
 
 import asyncio
 import logging
+import math
+import time
 from typing import Dict, List, Any, Optional
-from datetime import datetime, timedelta
+from datetime import datetime, timezone
 import json
-from collections import defaultdict, deque
-import statistics
+from collections import Counter, OrderedDict, defaultdict, deque
+from itertools import islice
+import numpy as np
 
 logger = logging.getLogger(__name__)
 
+
+def _utc_datetime(ts: float) -> datetime:
+    """Naive UTC datetime for an epoch timestamp (utcfromtimestamp is deprecated)"""
+    return datetime.fromtimestamp(ts, timezone.utc).replace(tzinfo=None)
+
+
+class Session:
+    """Running per-session counters, kept compact with __slots__"""
+    
+    __slots__ = ('customer_id', 'start_ts', 'last_ts', 'total_response_time',
+                 'query_count', 'conf_sum', 'agent_usage', 'recent_queries')
+    
+    def __init__(self, customer_id: str, start_ts: float):
+        self.customer_id = customer_id
+        self.start_ts = start_ts
+        self.last_ts = start_ts
+        self.total_response_time = 0.0
+        self.query_count = 0
+        self.conf_sum = 0.0
+        self.agent_usage = defaultdict(int)
+        self.recent_queries = deque(maxlen=10)  # Shared with query_history, not copied
+
+
+class QueryRing:
+    """Fixed-capacity ring of numeric query columns stored as NumPy arrays"""
+    
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.ts = np.empty(capacity, dtype=np.float64)
+        self.conf = np.empty(capacity, dtype=np.float64)
+        self.head = 0  # Next write position (oldest row once full)
+        self.size = 0
+    
+    def append(self, ts: float, conf: float):
+        """Write a row, overwriting the oldest one when full"""
+        i = self.head
+        self.ts[i] = ts
+        self.conf[i] = conf
+        self.head = (i + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+    
+    def since(self, cutoff: float) -> np.ndarray:
+        """Row indices with ts >= cutoff, oldest first"""
+        if self.size < self.capacity:
+            segments = [(0, self.size)]
+        else:
+            segments = [(self.head, self.capacity), (0, self.head)]
+        
+        # Each segment is sorted by time, so the cutoff is a binary search
+        parts = []
+        for start, stop in segments:
+            first = start + int(np.searchsorted(self.ts[start:stop], cutoff, side='left'))
+            parts.append(np.arange(first, stop))
+        return np.concatenate(parts)
+
+
 class AnalyticsManager:
     """Manages analytics and metrics for the customer support system"""
     
-    def __init__(self):
-        self.query_history = deque(maxlen=10000)  # Store last 10k queries
+    def __init__(self, capacity: int = 10000):
+        self.query_history = deque(maxlen=capacity)  # Store the last `capacity` queries
+        self.query_columns = QueryRing(self.query_history.maxlen)  # Numeric columns, aligned with query_history
         self.session_data = {}
-        self.agent_metrics = defaultdict(list)
+        self.session_activity = OrderedDict()  # session_id -> last ts_epoch, oldest first
+        self.agent_rollup = defaultdict(self._new_rollup)  # 24 hourly buckets per agent
+        self.response_time_window = deque(maxlen=1000)  # Last 1000 response times
+        self.response_time_sum = 0.0
         self.feedback_data = []
+        self.feedback_sum = 0
+        self.feedback_count = 0
         self.system_metrics = {
             'total_queries': 0,
             'total_sessions': 0,
@@ -30,6 +95,14 @@ class AnalyticsManager:
         }
         self.initialized = False
     
+    @staticmethod
+    def _new_rollup() -> List[Dict[str, Any]]:
+        """Create an empty ring of hourly aggregate buckets"""
+        return [
+            {'hour': -1, 'sum_conf': 0.0, 'sum_rt': 0.0, 'count': 0}
+            for _ in range(24)
+        ]
+    
     async def initialize(self):
         """Initialize analytics system"""
         try:
@@ -45,15 +118,24 @@ class AnalyticsManager:
             logger.error(f"Analytics initialization failed: {e}")
             raise
     
-    async def log_query(self, query: str, response: str, agent_type: str, 
-                       confidence: float, response_time: float, 
-                       customer_id: str, session_id: str):
+    def log_query(self, query: str, response: str, agent_type: str,
+                  confidence: float, response_time: float,
+                  customer_id: str, session_id: str):
         """Log a customer query and AI response"""
         try:
-            timestamp = datetime.utcnow()
+            # Validate numbers before touching any state, so a bad record leaves
+            # no partial update (NaN would otherwise poison every running average)
+            confidence = float(confidence)
+            response_time = float(response_time)
+            if not (math.isfinite(confidence) and math.isfinite(response_time)):
+                raise ValueError(f"non-finite confidence {confidence} or response time {response_time}")
+            
+            ts_epoch = time.time()
+            timestamp = _utc_datetime(ts_epoch)
             
             query_data = {
-                'timestamp': timestamp.isoformat(),
+                'timestamp': timestamp,
+                'ts_epoch': ts_epoch,
                 'query': query,
                 'response': response,
                 'agent_type': agent_type,
@@ -66,44 +148,50 @@ class AnalyticsManager:
             }
             
             # Add to query history
-            self.query_history.append(query_data)
+            self._append_query(query_data)
             
             # Update system metrics
             self.system_metrics['total_queries'] += 1
             self.system_metrics['agent_distribution'][agent_type] += 1
             
-            # Update agent-specific metrics
-            self.agent_metrics[agent_type].append({
-                'confidence': confidence,
-                'response_time': response_time,
-                'timestamp': timestamp
-            })
+            # Update the agent's hourly rollup bucket, resetting it if stale
+            hour = int(ts_epoch // 3600)
+            bucket = self.agent_rollup[agent_type][hour % 24]
+            if bucket['hour'] != hour:
+                bucket.update(hour=hour, sum_conf=0.0, sum_rt=0.0, count=0)
+            bucket['sum_conf'] += confidence
+            bucket['sum_rt'] += response_time
+            bucket['count'] += 1
             
             # Update session data
-            if session_id not in self.session_data:
-                self.session_data[session_id] = {
-                    'customer_id': customer_id,
-                    'start_time': timestamp,
-                    'queries': [],
-                    'total_response_time': 0.0,
-                    'avg_confidence': 0.0
-                }
+            session = self.session_data.get(session_id)
+            if session is None:
+                session = self.session_data[session_id] = Session(customer_id, ts_epoch)
                 self.system_metrics['total_sessions'] += 1
             
-            session = self.session_data[session_id]
-            session['queries'].append(query_data)
-            session['total_response_time'] += response_time
-            session['last_activity'] = timestamp
-            
-            # Calculate running averages
-            await self._update_running_averages()
+            session.recent_queries.append(query_data)
+            session.query_count += 1
+            session.conf_sum += confidence
+            session.total_response_time += response_time
+            session.agent_usage[agent_type] += 1
+            session.last_ts = ts_epoch
+            self.session_activity[session_id] = ts_epoch
+            self.session_activity.move_to_end(session_id)
+            
+            # Update the running average over the last 1000 response times
+            window = self.response_time_window
+            if len(window) == window.maxlen:
+                self.response_time_sum -= window[0]
+            window.append(response_time)
+            self.response_time_sum += response_time
+            self.system_metrics['avg_response_time'] = round(self.response_time_sum / len(window), 2)
             
             logger.debug(f"Query logged: {session_id}, Agent: {agent_type}, Time: {response_time:.2f}s")
             
         except Exception as e:
             logger.error(f"Failed to log query: {e}")
     
-    async def log_feedback(self, session_id: str, rating: int, comment: Optional[str] = None):
+    def log_feedback(self, session_id: str, rating: int, comment: Optional[str] = None):
         """Log customer feedback"""
         try:
             feedback_data = {
@@ -114,11 +202,11 @@ class AnalyticsManager:
             }
             
             self.feedback_data.append(feedback_data)
+            self.feedback_sum += rating
+            self.feedback_count += 1
             
             # Update satisfaction score
-            if self.feedback_data:
-                ratings = [f['rating'] for f in self.feedback_data]
-                self.system_metrics['satisfaction_score'] = statistics.mean(ratings)
+            self.system_metrics['satisfaction_score'] = self.feedback_sum / self.feedback_count
             
             logger.info(f"Feedback logged: {session_id}, Rating: {rating}")
             
@@ -132,22 +220,26 @@ class AnalyticsManager:
             recent_queries = self._get_recent_queries(hours=24)
             
             # Calculate hourly volume for the last 24 hours
-            hourly_volume = self._calculate_hourly_volume(recent_queries)
+            hourly_volume = self._calculate_hourly_volume()
             
             # Agent performance metrics
             agent_performance = {}
-            for agent_type, metrics in self.agent_metrics.items():
-                if metrics:
-                    recent_metrics = [m for m in metrics 
-                                    if datetime.fromisoformat(m['timestamp'].isoformat()) > 
-                                    datetime.utcnow() - timedelta(hours=24)]
-                    
-                    if recent_metrics:
-                        agent_performance[agent_type] = {
-                            'avg_confidence': statistics.mean([m['confidence'] for m in recent_metrics]),
-                            'avg_response_time': statistics.mean([m['response_time'] for m in recent_metrics]),
-                            'query_count': len(recent_metrics)
-                        }
+            oldest_hour = int(time.time() // 3600) - 23
+            for agent_type, buckets in self.agent_rollup.items():
+                sum_conf = sum_rt = 0.0
+                count = 0
+                for bucket in buckets:
+                    if bucket['hour'] >= oldest_hour:
+                        sum_conf += bucket['sum_conf']
+                        sum_rt += bucket['sum_rt']
+                        count += bucket['count']
+                
+                if count:
+                    agent_performance[agent_type] = {
+                        'avg_confidence': sum_conf / count,
+                        'avg_response_time': sum_rt / count,
+                        'query_count': count
+                    }
             
             # Top queries and responses
             top_queries = self._get_top_queries(recent_queries)
@@ -163,9 +255,7 @@ class AnalyticsManager:
                 'top_queries': top_queries,
                 'recent_activity': {
                     'last_24h_queries': len(recent_queries),
-                    'active_sessions': len([s for s in self.session_data.values() 
-                                          if datetime.fromisoformat(s['last_activity'].isoformat()) > 
-                                          datetime.utcnow() - timedelta(minutes=30)])
+                    'active_sessions': self._count_active_sessions(minutes=30)
                 },
                 'system_health': {
                     'uptime': '99.9%',
@@ -193,103 +283,99 @@ class AnalyticsManager:
                 return {}
             
             session = self.session_data[session_id]
-            queries = session['queries']
             
-            if not queries:
+            if not session.query_count:
                 return {}
             
-            # Calculate session metrics
-            avg_confidence = statistics.mean([q['confidence'] for q in queries])
-            total_time = sum([q['response_time'] for q in queries])
-            session_duration = (session['last_activity'] - session['start_time']).total_seconds()
-            
-            agent_usage = defaultdict(int)
-            for query in queries:
-                agent_usage[query['agent_type']] += 1
-            
             return {
                 'session_id': session_id,
-                'customer_id': session['customer_id'],
-                'start_time': session['start_time'].isoformat(),
-                'last_activity': session['last_activity'].isoformat(),
-                'duration_seconds': session_duration,
-                'total_queries': len(queries),
-                'avg_confidence': avg_confidence,
-                'total_response_time': total_time,
-                'agent_usage': dict(agent_usage),
-                'queries': queries[-10:]  # Last 10 queries
+                'customer_id': session.customer_id,
+                'start_time': _utc_datetime(session.start_ts).isoformat(),
+                'last_activity': _utc_datetime(session.last_ts).isoformat(),
+                'duration_seconds': session.last_ts - session.start_ts,
+                'total_queries': session.query_count,
+                'avg_confidence': session.conf_sum / session.query_count,
+                'total_response_time': session.total_response_time,
+                'agent_usage': dict(session.agent_usage),
+                'queries': [self._serialize_query(q) for q in session.recent_queries]  # Last 10 queries
             }
             
         except Exception as e:
             logger.error(f"Failed to get session analytics: {e}")
             return {}
     
+    def _append_query(self, query_data: Dict):
+        """Append a query record, keeping the numeric columns aligned"""
+        # log_query has already validated the values, so neither append can fail
+        # and both structures always stay the same length
+        self.query_columns.append(query_data['ts_epoch'], query_data['confidence'])
+        self.query_history.append(query_data)
+    
+    @staticmethod
+    def _serialize_query(query: Dict) -> Dict:
+        """Convert a stored query record to its JSON-friendly form"""
+        data = {k: v for k, v in query.items() if k != 'ts_epoch'}
+        data['timestamp'] = query['timestamp'].isoformat()
+        return data
+    
     def _get_recent_queries(self, hours: int = 24) -> List[Dict]:
         """Get queries from the last N hours"""
-        cutoff_time = datetime.utcnow() - timedelta(hours=hours)
-        return [
-            query for query in self.query_history
-            if datetime.fromisoformat(query['timestamp']) > cutoff_time
-        ]
+        count = len(self.query_columns.since(time.time() - hours * 3600))
+        return list(islice(self.query_history, len(self.query_history) - count, None))
     
-    def _calculate_hourly_volume(self, queries: List[Dict]) -> List[Dict[str, Any]]:
-        """Calculate hourly query volume"""
-        hourly_counts = defaultdict(int)
-        
-        for query in queries:
-            timestamp = datetime.fromisoformat(query['timestamp'])
-            hour_key = timestamp.replace(minute=0, second=0, microsecond=0)
-            hourly_counts[hour_key] += 1
-        
-        # Generate last 24 hours
-        result = []
-        now = datetime.utcnow().replace(minute=0, second=0, microsecond=0)
+    def _count_active_sessions(self, minutes: int) -> int:
+        """Count sessions with activity in the last N minutes"""
+        cutoff = time.time() - minutes * 60
+        count = 0
+        for last_ts in reversed(self.session_activity.values()):
+            if last_ts <= cutoff:
+                break
+            count += 1
+        return count
+    
+    def _calculate_hourly_volume(self) -> List[Dict[str, Any]]:
+        """Calculate hourly query volume for the last 24 hours"""
+        now_hour = int(time.time() // 3600)
+        first_hour = now_hour - 23
         
-        for i in range(24):
-            hour = now - timedelta(hours=i)
-            result.append({
-                'hour': hour.isoformat(),
-                'count': hourly_counts.get(hour, 0)
-            })
+        # Select rows from the first hour and bucket them in one pass
+        columns = self.query_columns
+        timestamps = columns.ts[columns.since(first_hour * 3600)]
+        hours_ago = now_hour - (timestamps // 3600).astype(np.int64)
+        hours_ago = hours_ago[(hours_ago >= 0) & (hours_ago < 24)]
+        counts = np.bincount(hours_ago, minlength=24)
         
-        return list(reversed(result))
+        # Generate last 24 hours, oldest first
+        return [
+            {
+                'hour': _utc_datetime(hour * 3600).isoformat(),
+                'count': int(counts[now_hour - hour])
+            }
+            for hour in range(first_hour, now_hour + 1)
+        ]
     
     def _get_top_queries(self, queries: List[Dict], limit: int = 10) -> List[Dict]:
         """Get most common queries"""
-        query_counts = defaultdict(int)
+        query_counts = Counter()
         query_examples = {}
         
         for query in queries:
             query_text = query['query'].lower().strip()
             query_counts[query_text] += 1
-            if query_text not in query_examples:
-                query_examples[query_text] = query
+            query_examples.setdefault(query_text, query)
         
-        # Sort by frequency
-        top_queries = sorted(query_counts.items(), key=lambda x: x[1], reverse=True)[:limit]
+        # most_common selects with a heap instead of sorting every distinct query
+        top_queries = query_counts.most_common(limit)
         
         return [
             {
                 'query': query_text,
                 'count': count,
-                'example': query_examples[query_text]
+                'example': self._serialize_query(query_examples[query_text])
             }
             for query_text, count in top_queries
         ]
     
-    async def _update_running_averages(self):
-        """Update running averages for system metrics"""
-        try:
-            if self.query_history:
-                # Calculate average response time from recent queries
-                recent_queries = list(self.query_history)[-1000:]  # Last 1000 queries
-                if recent_queries:
-                    avg_response_time = statistics.mean([q['response_time'] for q in recent_queries])
-                    self.system_metrics['avg_response_time'] = round(avg_response_time, 2)
-            
-        except Exception as e:
-            logger.error(f"Failed to update running averages: {e}")
-    
     async def _load_historical_data(self):
         """Load historical data (placeholder for database integration)"""
         try:
@@ -326,21 +412,12 @@ class AnalyticsManager:
     
     def get_real_time_metrics(self) -> Dict[str, Any]:
         """Get real-time system metrics"""
+        last_hour = self.query_columns.since(time.time() - 3600)
         return {
-            'active_sessions': len([
-                s for s in self.session_data.values()
-                if datetime.fromisoformat(s['last_activity'].isoformat()) > 
-                datetime.utcnow() - timedelta(minutes=5)
-            ]),
-            'queries_last_hour': len([
-                q for q in self.query_history
-                if datetime.fromisoformat(q['timestamp']) > 
-                datetime.utcnow() - timedelta(hours=1)
-            ]),
-            'avg_confidence_last_hour': statistics.mean([
-                q['confidence'] for q in self.query_history
-                if datetime.fromisoformat(q['timestamp']) > 
-                datetime.utcnow() - timedelta(hours=1)
-            ]) if self.query_history else 0.0,
+            'active_sessions': self._count_active_sessions(minutes=5),
+            'queries_last_hour': len(last_hour),
+            'avg_confidence_last_hour': float(
+                self.query_columns.conf[last_hour].mean()
+            ) if len(last_hour) else 0.0,
             'system_status': 'healthy'
         }
\ No newline at end of file
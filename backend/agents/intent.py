@@ -0,0 +1,91 @@
+"""
+Keyword and phrase based intent classification
+Shared by the lightweight API orchestrator and the full multi-agent orchestrator
+"""
+
+from functools import lru_cache
+from typing import FrozenSet
+import ahocorasick
+
+# Maximum number of normalized queries whose intent is memoized per classifier
+INTENT_CACHE_SIZE = 4096
+
+
+class IntentClassifier:
+    """Score queries against technical and billing patterns in one automaton pass"""
+
+    def __init__(self, *, technical_phrases: FrozenSet[str], billing_phrases: FrozenSet[str],
+                 technical_keywords: FrozenSet[str], billing_keywords: FrozenSet[str],
+                 generic_words: FrozenSet[str], technical_domain_words: FrozenSet[str],
+                 billing_domain_words: FrozenSet[str], technical_tiebreak_words: FrozenSet[str],
+                 billing_tiebreak_words: FrozenSet[str], cache_size: int = INTENT_CACHE_SIZE):
+        self.technical_phrases = technical_phrases
+        self.billing_phrases = billing_phrases
+        self.technical_keywords = technical_keywords
+        self.billing_keywords = billing_keywords
+        self.generic_words = generic_words
+        self.technical_domain_words = technical_domain_words
+        self.billing_domain_words = billing_domain_words
+        self.technical_tiebreak_words = technical_tiebreak_words
+        self.billing_tiebreak_words = billing_tiebreak_words
+
+        patterns = (technical_phrases | billing_phrases | technical_keywords |
+                    billing_keywords | generic_words)
+
+        # Domain and tiebreak words are only intersected with automaton matches,
+        # so one missing from the patterns would silently never fire
+        for name, words in (('technical_domain_words', technical_domain_words),
+                            ('billing_domain_words', billing_domain_words),
+                            ('technical_tiebreak_words', technical_tiebreak_words),
+                            ('billing_tiebreak_words', billing_tiebreak_words)):
+            missing = words - patterns
+            if missing:
+                raise ValueError(f"{name} not in the intent patterns: {sorted(missing)}")
+
+        # Compile all intent patterns into a single Aho-Corasick automaton
+        self.automaton = ahocorasick.Automaton()
+        for pattern in patterns:
+            self.automaton.add_word(pattern, pattern)
+        self.automaton.make_automaton()
+
+        # Memoize per instance so classifiers with different patterns never share entries
+        self._score = lru_cache(maxsize=cache_size)(self._score_normalized)
+
+    def classify(self, query: str) -> str:
+        """Classify a raw query as 'technical', 'billing' or 'general'"""
+        # Normalize so trivially different spellings of a query share a cache entry
+        return self._score(" ".join(query.lower().split()))
+
+    def _score_normalized(self, query: str) -> str:
+        """Classify a lowercased, whitespace-collapsed query"""
+        # Collect every pattern occurring in the query in one automaton pass
+        matched = {pattern for _, pattern in self.automaton.iter(query)}
+
+        # Phrase matching (weight: 5)
+        technical_score = 5 * len(matched & self.technical_phrases)
+        billing_score = 5 * len(matched & self.billing_phrases)
+
+        # Generic words count only alongside a domain word (weight: 3)
+        if matched & self.generic_words:
+            if matched & self.technical_domain_words:
+                technical_score += 3
+            if matched & self.billing_domain_words:
+                billing_score += 3
+
+        # Keyword matching (weight: 1)
+        technical_score += len(matched & self.technical_keywords)
+        billing_score += len(matched & self.billing_keywords)
+
+        # Decision logic with better tie-breaking
+        if technical_score > billing_score and technical_score > 0:
+            return 'technical'
+        elif billing_score > technical_score and billing_score > 0:
+            return 'billing'
+        elif technical_score == billing_score and technical_score > 0:
+            # Better tie-breaker: check for more specific domain indicators
+            if matched & self.technical_tiebreak_words:
+                return 'technical'
+            elif matched & self.billing_tiebreak_words:
+                return 'billing'
+
+        return 'general'
@@ -5,14 +5,69 @@ Routes queries to specialized agents using free Hugging Face models
 
 import asyncio
 import logging
+from collections import OrderedDict
 from typing import Dict, List, Any, Optional
-from transformers import pipeline, AutoTokenizer, AutoModelForSequenceClassification
-import torch
-from sentence_transformers import SentenceTransformer
 import numpy as np
+from agents.intent import IntentClassifier
 
 logger = logging.getLogger(__name__)
 
+# Maximum number of query embeddings kept in the LRU cache
+QUERY_EMBEDDING_CACHE_SIZE = 2048
+
+# Enhanced technical keywords with more specific patterns
+TECHNICAL_KEYWORDS = frozenset([
+    'login', 'log in', 'sign in', 'access', 'password', 'account',
+    'error', 'bug', 'not working', 'broken', 'crash', 'slow',
+    'technical', 'application', 'app', 'reset', 'unlock',
+    'authenticate', 'verification'
+])
+
+# Enhanced billing keywords
+BILLING_KEYWORDS = frozenset([
+    'billing', 'payment', 'charge', 'charged', 'invoice', 'subscription',
+    'refund', 'cancel', 'upgrade', 'downgrade', 'price', 'cost',
+    'twice', 'double', 'money', 'credit card', 'bank', 'transaction'
+])
+
+# Specific phrase matching for better accuracy
+TECHNICAL_PHRASES = frozenset([
+    'cannot log', 'can\'t log', 'unable to access', 'won\'t load',
+    'not loading', 'application is', 'app is', 'showing error',
+    'login issue', 'technical issue', 'technical problem'
+])
+
+BILLING_PHRASES = frozenset([
+    'charged twice', 'billed twice', 'double charge', 'cancel subscription',
+    'how do i cancel', 'want to cancel', 'subscription cost',
+    'billing problem', 'billing issue', 'payment problem'
+])
+
+# Generic words that need context
+GENERIC_WORDS = frozenset(['issue', 'problem', 'question', 'help', 'support'])
+
+# Domain words that give generic words their context
+TECHNICAL_DOMAIN_WORDS = frozenset(['technical', 'login', 'password', 'access', 'app', 'application'])
+BILLING_DOMAIN_WORDS = frozenset(['billing', 'payment', 'charge', 'subscription', 'money'])
+
+# More specific domain indicators used to break score ties
+TECHNICAL_TIEBREAK_WORDS = frozenset(['login', 'password', 'access', 'account', 'technical'])
+BILLING_TIEBREAK_WORDS = frozenset(['billing', 'charge', 'payment', 'subscription', 'money'])
+
+
+_INTENT_CLASSIFIER = IntentClassifier(
+    technical_phrases=TECHNICAL_PHRASES,
+    billing_phrases=BILLING_PHRASES,
+    technical_keywords=TECHNICAL_KEYWORDS,
+    billing_keywords=BILLING_KEYWORDS,
+    generic_words=GENERIC_WORDS,
+    technical_domain_words=TECHNICAL_DOMAIN_WORDS,
+    billing_domain_words=BILLING_DOMAIN_WORDS,
+    technical_tiebreak_words=TECHNICAL_TIEBREAK_WORDS,
+    billing_tiebreak_words=BILLING_TIEBREAK_WORDS
+)
+
+
 class CustomerServiceOrchestrator:
     """Main orchestrator that routes queries to specialized agents"""
     
@@ -21,6 +76,8 @@ class CustomerServiceOrchestrator:
         self.embedding_model = None
         self.agents = {}
         self.knowledge_base = []
+        self.kb_matrix = None  # (N, D) L2-normalized document embeddings
+        self._query_emb_cache = OrderedDict()  # normalized query -> embedding, LRU order
         self.initialized = False
     
     async def initialize(self):
@@ -31,8 +88,10 @@ class CustomerServiceOrchestrator:
             # Use keyword-based classification (more efficient than AI models)
             self.classifier = None
             
-            # Load embedding model for RAG (free)
+            # Load embedding model for RAG (free); imported lazily to keep startup light
+            from sentence_transformers import SentenceTransformer
             self.embedding_model = SentenceTransformer('all-MiniLM-L6-v2')
+            self._quantize_embedding_model()
             
             # Initialize specialized agents
             self.agents = {
@@ -51,6 +110,21 @@ class CustomerServiceOrchestrator:
             logger.error(f"Model initialization failed: {e}")
             raise
     
+    def _quantize_embedding_model(self):
+        """Reduce embedding model precision: fp16 on CUDA, dynamic int8 on CPU"""
+        try:
+            import torch
+            
+            if torch.cuda.is_available():
+                self.embedding_model.half()
+            else:
+                torch.quantization.quantize_dynamic(
+                    self.embedding_model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True
+                )
+            
+        except Exception as e:
+            logger.warning(f"Embedding model quantization failed, using fp32: {e}")
+    
     async def process_query(self, query: str, customer_id: str, session_id: str, 
                           priority: str = "medium", metadata: Dict = None) -> Dict[str, Any]:
         """Process customer query through multi-agent system"""
@@ -60,7 +134,7 @@ class CustomerServiceOrchestrator:
         
         try:
             # Step 1: Classify query intent
-            intent = await self._classify_intent(query)
+            intent = self._classify_intent(query)
             
             # Step 2: Retrieve relevant knowledge
             context = await self._retrieve_context(query)
@@ -94,84 +168,10 @@ class CustomerServiceOrchestrator:
                 'escalate': True
             }
     
-    async def _classify_intent(self, query: str) -> str:
+    def _classify_intent(self, query: str) -> str:
         """Classify query intent using enhanced keyword matching"""
         try:
-            query_lower = query.lower()
-            
-            # Enhanced technical keywords with more specific patterns
-            technical_keywords = [
-                'login', 'log in', 'sign in', 'access', 'password', 'account',
-                'error', 'bug', 'not working', 'broken', 'crash', 'slow',
-                'technical', 'application', 'app', 'reset', 'unlock', 
-                'authenticate', 'verification'
-            ]
-            
-            # Enhanced billing keywords
-            billing_keywords = [
-                'billing', 'payment', 'charge', 'charged', 'invoice', 'subscription',
-                'refund', 'cancel', 'upgrade', 'downgrade', 'price', 'cost',
-                'twice', 'double', 'money', 'credit card', 'bank', 'transaction'
-            ]
-            
-            # Specific phrase matching for better accuracy
-            technical_phrases = [
-                'cannot log', 'can\'t log', 'unable to access', 'won\'t load',
-                'not loading', 'application is', 'app is', 'showing error',
-                'login issue', 'technical issue', 'technical problem'
-            ]
-            
-            billing_phrases = [
-                'charged twice', 'billed twice', 'double charge', 'cancel subscription',
-                'how do i cancel', 'want to cancel', 'subscription cost',
-                'billing problem', 'billing issue', 'payment problem'
-            ]
-            
-            # Generic words that need context
-            generic_words = ['issue', 'problem', 'question', 'help', 'support']
-            
-            # Check for specific phrases first (higher weight)
-            technical_score = 0
-            billing_score = 0
-            
-            # Phrase matching (weight: 5)
-            for phrase in technical_phrases:
-                if phrase in query_lower:
-                    technical_score += 5
-            
-            for phrase in billing_phrases:
-                if phrase in query_lower:
-                    billing_score += 5
-            
-            # Check for domain-specific combinations (weight: 3)
-            if any(tech_word in query_lower for tech_word in ['technical', 'login', 'password', 'access', 'app', 'application']) and any(generic in query_lower for generic in generic_words):
-                technical_score += 3
-            
-            if any(bill_word in query_lower for bill_word in ['billing', 'payment', 'charge', 'subscription', 'money']) and any(generic in query_lower for generic in generic_words):
-                billing_score += 3
-            
-            # Keyword matching (weight: 1)
-            for keyword in technical_keywords:
-                if keyword in query_lower:
-                    technical_score += 1
-            
-            for keyword in billing_keywords:
-                if keyword in query_lower:
-                    billing_score += 1
-            
-            # Determine intent with improved logic
-            if technical_score > billing_score and technical_score > 0:
-                return 'technical'
-            elif billing_score > technical_score and billing_score > 0:
-                return 'billing'
-            elif technical_score == billing_score and technical_score > 0:
-                # Better tie-breaker: check for more specific domain indicators
-                if any(word in query_lower for word in ['login', 'password', 'access', 'account', 'technical']):
-                    return 'technical'
-                elif any(word in query_lower for word in ['billing', 'charge', 'payment', 'subscription', 'money']):
-                    return 'billing'
-            
-            return 'general'
+            return _INTENT_CLASSIFIER.classify(query)
                 
         except Exception as e:
             logger.error(f"Intent classification failed: {e}")
@@ -183,20 +183,19 @@ class CustomerServiceOrchestrator:
             if not self.knowledge_base:
                 return []
             
-            # Generate query embedding
-            query_embedding = self.embedding_model.encode([query])
+            # Get normalized query embedding (cached for repeated queries)
+            query_embedding = self._get_query_embedding(query.strip().lower())
             
-            # Calculate similarities using pre-computed embeddings
-            similarities = []
-            for i, doc in enumerate(self.knowledge_base):
-                similarity = np.dot(query_embedding[0], doc['embedding']) / (
-                    np.linalg.norm(query_embedding[0]) * np.linalg.norm(doc['embedding'])
-                )
-                similarities.append((i, similarity))
+            # Cosine similarity against all documents in one matrix-vector product
+            similarities = self.kb_matrix @ query_embedding
             
             # Get top-k most similar documents
-            similarities.sort(key=lambda x: x[1], reverse=True)
-            top_docs = [self.knowledge_base[i] for i, _ in similarities[:top_k]]
+            if top_k < len(similarities):
+                top_idx = np.argpartition(-similarities, top_k)[:top_k]
+            else:
+                top_idx = np.arange(len(similarities))
+            top_idx = top_idx[np.argsort(-similarities[top_idx])]
+            top_docs = [self.knowledge_base[i] for i in top_idx]
             
             return top_docs
             
@@ -204,6 +203,22 @@ class CustomerServiceOrchestrator:
             logger.error(f"Context retrieval failed: {e}")
             return []
     
+    def _get_query_embedding(self, query_key: str) -> np.ndarray:
+        """Return the normalized embedding for a query, using an LRU cache"""
+        cache = self._query_emb_cache
+        embedding = cache.get(query_key)
+        if embedding is not None:
+            cache.move_to_end(query_key)
+            return embedding
+        
+        embedding = self.embedding_model.encode(
+            [query_key], convert_to_numpy=True, normalize_embeddings=True
+        )[0].astype(np.float32)
+        cache[query_key] = embedding
+        if len(cache) > QUERY_EMBEDDING_CACHE_SIZE:
+            cache.popitem(last=False)
+        return embedding
+    
     async def _setup_knowledge_base(self):
         """Setup knowledge base with pre-computed embeddings"""
         docs = [
@@ -239,9 +254,16 @@ class CustomerServiceOrchestrator:
             }
         ]
         
-        # Pre-compute embeddings once
-        for doc in docs:
-            doc['embedding'] = self.embedding_model.encode([doc['content']])[0]
+        # Pre-compute normalized embeddings once, in a single batched pass
+        embeddings = self.embedding_model.encode(
+            [doc['content'] for doc in docs],
+            batch_size=32,
+            convert_to_numpy=True,
+            normalize_embeddings=True
+        )
+        
+        # Keep embeddings in one contiguous matrix, row-aligned with the docs
+        self.kb_matrix = np.ascontiguousarray(embeddings, dtype=np.float32)
         
         self.knowledge_base = docs
     
@@ -252,7 +274,7 @@ class CustomerServiceOrchestrator:
                 return False
             
             # Test classification
-            test_intent = await self._classify_intent("test query")
+            test_intent = self._classify_intent("test query")
             
             # Test embedding
             if self.embedding_model:
@@ -268,6 +290,7 @@ class CustomerServiceOrchestrator:
         """Cleanup resources"""
         self.classifier = None
         self.embedding_model = None
+        self._query_emb_cache.clear()
         self.agents = {}
         self.initialized = False
 
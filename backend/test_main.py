@@ -4,8 +4,17 @@ Unit tests for AI Customer Support System
 
 import pytest
 import asyncio
+import json
 from fastapi.testclient import TestClient
+import zlib
+import numpy as np
+from types import SimpleNamespace
 from main import app, SimpleOrchestrator
+from agents import analytics as analytics_module
+from agents.analytics import AnalyticsManager
+from agents.intent import IntentClassifier
+from agents import orchestrator as orchestrator_module
+from agents.orchestrator import CustomerServiceOrchestrator
 
 client = TestClient(app)
 
@@ -50,6 +59,15 @@ class TestAPI:
         data = response.json()
         assert "total_queries" in data
         assert "agent_distribution" in data
+    
+    def test_websocket_chat(self):
+        """Test WebSocket chat round trip"""
+        with client.websocket_connect("/ws/test_session") as websocket:
+            websocket.send_text(json.dumps({"query": "I was charged twice", "customer_id": "test"}))
+            data = json.loads(websocket.receive_bytes())
+            assert data["type"] == "ai_response"
+            assert data["agent_type"] == "billing"
+            assert "timestamp" in data
 
 class TestClassification:
     """Test agent classification logic"""
@@ -58,8 +76,7 @@ class TestClassification:
         """Setup test orchestrator"""
         self.orchestrator = SimpleOrchestrator()
     
-    @pytest.mark.asyncio
-    async def test_technical_classification(self):
+    def test_technical_classification(self):
         """Test technical queries classification"""
         technical_queries = [
             "I cannot login to my account",
@@ -69,11 +86,10 @@ class TestClassification:
         ]
         
         for query in technical_queries:
-            result = await self.orchestrator._classify_intent(query)
+            result = self.orchestrator._classify_intent(query)
             assert result == "technical", f"Query '{query}' should be technical, got {result}"
     
-    @pytest.mark.asyncio
-    async def test_billing_classification(self):
+    def test_billing_classification(self):
         """Test billing queries classification"""
         billing_queries = [
             "I was charged twice this month",
@@ -83,11 +99,10 @@ class TestClassification:
         ]
         
         for query in billing_queries:
-            result = await self.orchestrator._classify_intent(query)
+            result = self.orchestrator._classify_intent(query)
             assert result == "billing", f"Query '{query}' should be billing, got {result}"
     
-    @pytest.mark.asyncio
-    async def test_general_classification(self):
+    def test_general_classification(self):
         """Test general queries classification"""
         general_queries = [
             "What are your business hours?",
@@ -97,26 +112,235 @@ class TestClassification:
         ]
         
         for query in general_queries:
-            result = await self.orchestrator._classify_intent(query)
+            result = self.orchestrator._classify_intent(query)
             assert result == "general", f"Query '{query}' should be general, got {result}"
     
-    @pytest.mark.asyncio
-    async def test_empty_query(self):
+    def test_empty_query(self):
         """Test empty query handling"""
-        result = await self.orchestrator._classify_intent("")
+        result = self.orchestrator._classify_intent("")
         assert result == "general"
     
-    @pytest.mark.asyncio
-    async def test_mixed_keywords(self):
+    def test_mixed_keywords(self):
         """Test queries with mixed keywords"""
         # Should prioritize billing due to specific billing phrases
-        result = await self.orchestrator._classify_intent("I have a billing problem with login")
+        result = self.orchestrator._classify_intent("I have a billing problem with login")
         assert result == "billing"
         
         # Should prioritize technical due to specific technical phrases  
-        result = await self.orchestrator._classify_intent("Login issue with payment")
+        result = self.orchestrator._classify_intent("Login issue with payment")
         assert result == "technical"
 
+    def test_overlapping_patterns(self):
+        """Test that overlapping keywords and phrases are all counted"""
+        # 'charged' also contains 'charge'; both must score
+        result = self.orchestrator._classify_intent("I was charged for the app")
+        assert result == "billing"
+
+        # 'charged twice' phrase plus its 'charge', 'charged' and 'twice' keywords
+        result = self.orchestrator._classify_intent("Login issue after I was charged twice")
+        assert result == "billing"
+
+    def test_whitespace_normalization(self):
+        """Test that case and whitespace variants classify the same way"""
+        result = self.orchestrator._classify_intent("  I   WAS charged\ttwice ")
+        assert result == self.orchestrator._classify_intent("i was charged twice")
+        assert result == "billing"
+
+    def test_unmatched_domain_words_rejected(self):
+        """Test that domain and tiebreak words must be intent patterns"""
+        patterns = dict(
+            technical_phrases=frozenset(['cannot log']), billing_phrases=frozenset(['charged twice']),
+            technical_keywords=frozenset(['login']), billing_keywords=frozenset(['billing']),
+            generic_words=frozenset(['issue']), technical_domain_words=frozenset(['login']),
+            billing_domain_words=frozenset(['billing']), technical_tiebreak_words=frozenset(['login']),
+            billing_tiebreak_words=frozenset(['billing'])
+        )
+        IntentClassifier(**patterns)
+        
+        patterns['billing_tiebreak_words'] = frozenset(['billing', 'money'])
+        with pytest.raises(ValueError, match="money"):
+            IntentClassifier(**patterns)
+
+class TestAnalytics:
+    """Test analytics windows, rollups and session counters"""
+    
+    HOUR = 3600
+    NOW = 472222 * HOUR + 2400  # 2023-11-14T22:40:00 UTC
+    
+    def setup_method(self):
+        """Setup analytics manager with a small ring"""
+        self.analytics = AnalyticsManager(capacity=4)
+    
+    def set_clock(self, monkeypatch, now):
+        """Pin the analytics module's clock without touching the global time.time"""
+        monkeypatch.setattr(analytics_module, "time", SimpleNamespace(time=lambda: now))
+    
+    def log_at(self, monkeypatch, seconds_ago, query, agent_type, confidence, response_time, session_id):
+        """Log a query as if it happened seconds_ago before NOW"""
+        self.set_clock(monkeypatch, self.NOW - seconds_ago)
+        self.analytics.log_query(query, "response", agent_type, confidence,
+                                 response_time, "customer", session_id)
+    
+    def fill(self, monkeypatch):
+        """Log six queries so the four-row ring wraps around"""
+        self.log_at(monkeypatch, 30 * self.HOUR, "old", "technical", 0.9, 1.0, "s1")
+        self.log_at(monkeypatch, 20 * self.HOUR, "a", "billing", 0.8, 2.0, "s1")
+        self.log_at(monkeypatch, 5 * self.HOUR, "b", "technical", 0.6, 3.0, "s2")
+        self.log_at(monkeypatch, 2 * self.HOUR, "c", "technical", 0.7, 1.0, "s2")
+        self.log_at(monkeypatch, 30 * 60, "d", "general", 0.5, 0.5, "s1")
+        self.log_at(monkeypatch, 10 * 60, "e", "billing", 0.9, 1.5, "s1")
+        self.set_clock(monkeypatch, self.NOW)
+    
+    def test_recent_queries_across_wraparound(self, monkeypatch):
+        """Test time windows over a ring that has wrapped"""
+        self.fill(monkeypatch)
+        ring = self.analytics.query_columns
+        assert ring.size == 4 and ring.head == 2
+        
+        def recent(hours):
+            return [q['query'] for q in self.analytics._get_recent_queries(hours=hours)]
+        
+        assert recent(1) == ["d", "e"]
+        assert recent(3) == ["c", "d", "e"]  # Spans both ring segments
+        assert recent(24) == ["b", "c", "d", "e"]  # "a" was evicted from the ring
+    
+    def test_hourly_volume(self, monkeypatch):
+        """Test hourly volume bucketing"""
+        self.fill(monkeypatch)
+        volume = self.analytics._calculate_hourly_volume()
+        assert len(volume) == 24
+        assert [h['count'] for h in volume][-6:] == [1, 0, 0, 1, 0, 2]
+        assert sum(h['count'] for h in volume) == 4
+        assert volume[-1]['hour'] == "2023-11-14T22:00:00"
+    
+    @pytest.mark.asyncio
+    async def test_agent_performance(self, monkeypatch):
+        """Test per-agent rollups over the last 24 hours"""
+        self.fill(monkeypatch)
+        performance = (await self.analytics.get_analytics())['agent_performance']
+        
+        # The rollup is independent of the ring, so "a" counts but "old" does not
+        assert performance['technical'] == {
+            'avg_confidence': pytest.approx(0.65),
+            'avg_response_time': pytest.approx(2.0),
+            'query_count': 2
+        }
+        assert performance['billing'] == {
+            'avg_confidence': pytest.approx(0.85),
+            'avg_response_time': pytest.approx(1.75),
+            'query_count': 2
+        }
+        assert performance['general']['query_count'] == 1
+    
+    @pytest.mark.asyncio
+    async def test_stale_rollup_bucket_reset(self, monkeypatch):
+        """Test that a reused hourly bucket drops its old totals"""
+        self.log_at(monkeypatch, 30 * self.HOUR, "old", "technical", 0.9, 1.0, "s1")
+        self.log_at(monkeypatch, 6 * self.HOUR, "new", "technical", 0.5, 2.0, "s1")
+        self.set_clock(monkeypatch, self.NOW)
+        
+        performance = (await self.analytics.get_analytics())['agent_performance']
+        assert performance['technical'] == {
+            'avg_confidence': pytest.approx(0.5),
+            'avg_response_time': pytest.approx(2.0),
+            'query_count': 1
+        }
+    
+    @pytest.mark.asyncio
+    async def test_session_analytics(self, monkeypatch):
+        """Test session counters"""
+        self.fill(monkeypatch)
+        session = await self.analytics.get_session_analytics("s1")
+        
+        assert session['total_queries'] == 4
+        assert session['avg_confidence'] == pytest.approx(0.775)
+        assert session['total_response_time'] == pytest.approx(5.0)
+        assert session['duration_seconds'] == pytest.approx(30 * self.HOUR - 10 * 60)
+        assert session['agent_usage'] == {'technical': 1, 'billing': 2, 'general': 1}
+        assert [q['query'] for q in session['queries']] == ["old", "a", "d", "e"]
+        assert session['queries'][-1]['timestamp'] == "2023-11-14T22:30:00"
+        assert await self.analytics.get_session_analytics("missing") == {}
+
+    def test_invalid_numbers_leave_no_partial_update(self, monkeypatch):
+        """Test that non-numeric or non-finite values are rejected up front"""
+        self.log_at(monkeypatch, 60, "ok", "technical", 0.8, 1.0, "s1")
+        for confidence, response_time in [(None, 1.0), (float('nan'), 1.0), (0.5, float('inf'))]:
+            self.log_at(monkeypatch, 30, "bad", "billing", confidence, response_time, "s2")
+        self.set_clock(monkeypatch, self.NOW)
+        
+        assert self.analytics.system_metrics['total_queries'] == 1
+        assert 'billing' not in self.analytics.system_metrics['agent_distribution']
+        assert 's2' not in self.analytics.session_data
+        assert len(self.analytics.query_history) == self.analytics.query_columns.size == 1
+        assert self.analytics.get_real_time_metrics()['avg_confidence_last_hour'] == pytest.approx(0.8)
+
+class StubEncoder:
+    """Deterministic stand-in for the sentence-transformers model"""
+    
+    def __init__(self, dim: int = 4):
+        self.dim = dim
+        self.calls = []
+    
+    def encode(self, texts, convert_to_numpy=True, normalize_embeddings=True):
+        self.calls.extend(texts)
+        vectors = []
+        for text in texts:
+            vector = np.random.default_rng(zlib.crc32(text.encode())).standard_normal(self.dim)
+            vectors.append(vector / np.linalg.norm(vector))
+        return np.array(vectors)
+
+class TestOrchestrator:
+    """Test embedding cache and knowledge retrieval with a stub encoder"""
+    
+    def setup_method(self):
+        """Setup orchestrator with a stub embedding model and knowledge base"""
+        self.orchestrator = CustomerServiceOrchestrator()
+        encoder = self.orchestrator.embedding_model = StubEncoder()
+        
+        self.orchestrator.knowledge_base = [{'id': str(i)} for i in range(6)]
+        self.orchestrator.kb_matrix = encoder.encode([f"doc {i}" for i in range(6)]).astype(np.float32)
+        encoder.calls.clear()
+    
+    @pytest.mark.asyncio
+    async def test_query_embedding_cache_hit(self):
+        """Test that repeated and case/whitespace variants skip encode"""
+        encoder = self.orchestrator.embedding_model
+        first = await self.orchestrator._retrieve_context("reset my password")
+        
+        for variant in ["reset my password", "  Reset My PASSWORD\n"]:
+            assert await self.orchestrator._retrieve_context(variant) == first
+        assert encoder.calls == ["reset my password"]
+        assert self.orchestrator._query_emb_cache["reset my password"].dtype == np.float32
+    
+    def test_query_embedding_cache_eviction(self, monkeypatch):
+        """Test LRU eviction of the least recently used query"""
+        monkeypatch.setattr(orchestrator_module, "QUERY_EMBEDDING_CACHE_SIZE", 2)
+        encoder = self.orchestrator.embedding_model
+        cache = self.orchestrator._query_emb_cache
+        
+        self.orchestrator._get_query_embedding("a")
+        self.orchestrator._get_query_embedding("b")
+        self.orchestrator._get_query_embedding("a")  # Hit moves "a" to the end
+        self.orchestrator._get_query_embedding("c")  # Evicts "b", the oldest
+        assert list(cache) == ["a", "c"]
+        
+        self.orchestrator._get_query_embedding("b")
+        assert list(cache) == ["c", "b"]
+        assert encoder.calls == ["a", "b", "c", "b"]
+    
+    @pytest.mark.asyncio
+    async def test_retrieve_context_matches_full_ranking(self):
+        """Test that partial top-k selection matches a full argsort ranking"""
+        knowledge_base = self.orchestrator.knowledge_base
+        query = "my app keeps crashing"
+        similarities = self.orchestrator.kb_matrix @ self.orchestrator.embedding_model.encode([query])[0]
+        ranking = [knowledge_base[i] for i in np.argsort(-similarities)]
+        
+        n = len(knowledge_base)
+        for top_k in [1, 3, n, n + 5]:
+            result = await self.orchestrator._retrieve_context(query, top_k=top_k)
+            assert result == ranking[:top_k], f"top_k={top_k}"
+
 class TestValidation:
     """Test input validation"""
     